@@ -1,36 +1,141 @@
-import gc
+import atexit
+import copyreg
+import itertools
+import os
+import queue
 import sys
+import tempfile
+import threading
 import time
-from functools import wraps
+import weakref
+from contextlib import contextmanager
+from multiprocessing import resource_tracker
 from multiprocessing.shared_memory import SharedMemory
-from multiprocessing import RLock
 import pickle
+import struct
 import dill
 
-_lock = RLock()
+try:
+    import fcntl
+except ImportError:  # Windows, the lock only covers the threads of this process
+    fcntl = None
+try:
+    import _posixshmem
+except ImportError:  # Windows, a block goes away with its last handle
+    _posixshmem = None
+
 cfg = sys.modules[__name__]
 cfg.protocol = pickle.HIGHEST_PROTOCOL
 cfg.with_lock = True
+# only one instance per shared memory block, in this process: reads don't check
+# the shared memory block for changes, writes still go there
+cfg.single_process = False
+# default for the write_behind argument of the classes: changes are written to the
+# shared memory block by a background thread, see flush()
+cfg.write_behind = False
+
+# every shared memory block starts with the header
+#   [u64 payload length][u64 sequence number][u64 sequence number of the snapshot]
+#   [u64 journal start][u64 journal end][u64 generation][u64 snapshot start]
+# The snapshot, at snapshot start, is the pickled payload and its protocol 5
+# out-of-band buffers as [u64 count] and count times [u64 size][raw bytes]. It is
+# followed by the journal of changes made since the snapshot: [pickled (method
+# name, args)][u64 seqno][u64 size of the pickle] per change. The rest of the block
+# is free, a new snapshot is written there (see update_nonlock).
+_header = struct.Struct("<QQQQQQQ")
+_buflen = struct.Struct("<Q")
+# single header fields, _seqno and _gen only for reading: their pack_into would
+# zero the fields in front, single fields are written with _u64 at _*_AT
+_seqno = struct.Struct("<8xQ")
+_gen = struct.Struct("<40xQ")
+_u64 = struct.Struct("<Q")
+_SEQNO_AT = 8
+_GEN_AT = 40
+_record = struct.Struct("<QQ")
+HEADER_SIZE = _header.size
+_DICT_ITEMS_TYPE = type({}.items())
+_MISSING = object()
+# types the stdlib pickler has refused, see _learn_dill_only
+_dill_only_types = set()
+_DILL_ONLY_MAX = 64
+# containers pickle refused although _learn_dill_only found no new type in them
+_dill_only_objects = weakref.WeakValueDictionary()
+# values of these types can't be changed in place, equal means nothing to write
+_IMMUTABLE_TYPES = frozenset((int, float, complex, bool, str, bytes, type(None)))
+# keys of these types still compare equal after a pickle round trip, so a change
+# addressed by such a key can be replayed from the journal
+_JOURNAL_KEY_TYPES = frozenset((int, bool, str, bytes, type(None)))
+
+
+class _MemLock:
+    # Reentrant lock for one shared memory block: an RLock for the threads of this
+    # process plus, on POSIX, flock() on a lock file for other processes. The kernel
+    # drops the flock when its holder dies, a crashed process can't wedge the block.
+    def __init__(self, name):
+        self.path = os.path.join(
+            tempfile.gettempdir(), f"sharedbuiltinmutables_{name}.lock"
+        )
+        self._rlock = threading.RLock()
+        self._depth = 0
+        self._fd = None
+        self._pid = None
+        self._closer = None
+
+    def _open(self):
+        if self._closer is not None:
+            self._closer()
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        self._pid = os.getpid()
+        self._closer = weakref.finalize(self, os.close, self._fd)
+        # still needed by the exit hook flushing write_behind, the OS closes it anyway
+        self._closer.atexit = False
+
+    def __enter__(self):
+        if not cfg.with_lock:
+            return
+        self._rlock.acquire()
+        if self._depth == 0 and fcntl is not None:
+            if self._pid != os.getpid():
+                # a forked child shares the parent's open file and with it the flock
+                self._open()
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+        self._depth += 1
+
+    def __exit__(self, *exc_info):
+        if not cfg.with_lock:
+            return
+        self._depth -= 1
+        if self._depth == 0 and fcntl is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        self._rlock.release()
+
+    def unlink(self):
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
 
 
-def lock(func):
-    @wraps(func)
-    def wrapper(*args, **kwargs):
-        if cfg.with_lock:
-            try:
-                _lock.acquire()
-            except Exception:
-                pass
-        try:
-            return func(*args, **kwargs)
-        finally:
-            if cfg.with_lock:
-                try:
-                    _lock.release()
-                except Exception:
-                    pass
+_memlocks = weakref.WeakValueDictionary()
+_memlocks_guard = threading.Lock()
 
-    return wrapper
+
+def get_memlock(name):
+    # all instances of a block in this process share its lock, so nesting
+    # operations on two of them can't deadlock
+    with _memlocks_guard:
+        memlock = _memlocks.get(name)
+        if memlock is None:
+            memlock = _memlocks[name] = _MemLock(name)
+        return memlock
+
+
+def _same_value(old, new):
+    return (
+        type(old) is type(new)
+        and type(new) in _IMMUTABLE_TYPES
+        and (old is new or old == new)
+    )
 
 
 def get_or_create_memory_block(name: str, size: int, newval=None) -> SharedMemory:
@@ -57,55 +162,656 @@ def get_or_create_memory_block(name: str, size: int, newval=None) -> SharedMemor
     # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
     # SOFTWARE.
     try:
-        return SharedMemory(name=name), True
+        return _open_block(name), True
     except FileNotFoundError:
-        dm = SharedMemory(name=name, create=True, size=size)
-        asdill = dill.dumps(newval, protocol=cfg.protocol)
-        dm.buf[: len(asdill)] = asdill
+        needed = _measure(newval)
+        if size is None or size < needed:
+            size = _block_size(needed)
+        dm = _open_block(name, create=True, size=size)
+        update_nonlock(dm, newval)
         return dm, False
 
 
-def loader_nonlock(memblock, oldhash):
-    hashval = hash(bytes(memblock.buf))
-    if hashval == oldhash:
-        return None, hashval
-    return dill.loads(memblock.buf), hashval
+def _open_block(name, create=False, size=0):
+    # The resource tracker of multiprocessing unlinks the blocks a process made or
+    # opened when it exits, but the blocks have to outlive any single process that
+    # uses them. They are taken off the tracker, only update_growing_nonlock and the
+    # creator's close_memory_blocks unlink them (with _unlink_block).
+    memblock = SharedMemory(name=name, create=create, size=size)
+    if _posixshmem is not None:
+        resource_tracker.unregister(memblock._name, "shared_memory")
+    return memblock
 
 
-@lock
-def loader(memblock, oldhash):
-    hashval = hash(bytes(memblock.buf))
-    if hashval == oldhash:
-        return None, hashval
-    return dill.loads(memblock.buf), hashval
+def _unlink_block(memblock):
+    # SharedMemory.unlink would unregister it from the tracker a second time
+    if _posixshmem is not None:
+        _posixshmem.shm_unlink(memblock._name)
 
 
-def update_nonlock(memblock, it):
+# When the data outgrows its block it moves to a bigger one, named like the first
+# block (the root) plus "_<generation>". The root stays and its header always
+# holds the current generation, so everyone can find the data.
+def _block_size(needed):
+    return max(4096, 1 << (needed.bit_length() + 1))
+
+
+def generation_name(name, gen):
+    return f"{name}_{gen}" if gen else name
+
+
+def open_generation(root, gen):
+    return _open_block(generation_name(root.name, gen)) if gen else root
+
+
+def grow_memory_block(root, memblock, size):
+    # Copies memblock (the current generation) into a new block of size bytes and
+    # makes that the current generation. The caller unlinks memblock if it isn't root.
+    seq = _seqno.unpack_from(memblock.buf)[0]
+    logend, gen = _header.unpack_from(memblock.buf)[4:6]
+    gen += 1
+    name = generation_name(root.name, gen)
     try:
-        if str(it.__class__) == "<class 'dict_items'>":
-            asdill = dill.dumps(it, recurse=True, protocol=cfg.protocol)
+        new = _open_block(name, create=True, size=size)
+    except FileExistsError:  # left behind by a process that died while growing
+        stale = _open_block(name)
+        stale.close()
+        _unlink_block(stale)
+        new = _open_block(name, create=True, size=size)
+    new.buf[:logend] = memblock.buf[:logend]
+    _u64.pack_into(new.buf, _GEN_AT, gen)
+    _u64.pack_into(root.buf, _GEN_AT, gen)
+    # readers of memblock see its seqno change and go looking for the new generation
+    _u64.pack_into(memblock.buf, _SEQNO_AT, seq + 1)
+    return new
+
+
+def _read_buffers(buf, offset):
+    # out-of-band buffers are copied out, the objects built from them must not
+    # alias the shared memory block (its space is reused by later updates)
+    (count,) = _buflen.unpack_from(buf, offset)
+    offset += _buflen.size
+    buffers = []
+    for _ in range(count):
+        (size,) = _buflen.unpack_from(buf, offset)
+        offset += _buflen.size
+        buffers.append(bytearray(buf[offset : offset + size]))
+        offset += size
+    return buffers
+
+
+def _loads(payload, buffers=()):
+    try:
+        return pickle.loads(payload, buffers=buffers)
+    except pickle.UnpicklingError:
+        return dill.loads(payload)
+    finally:
+        payload.release()
+
+
+def _read_journal(buf, start, end, after):
+    # walks backwards from the newest change, readers usually lag only a few changes
+    changes = []
+    while end > start:
+        seq, size = _record.unpack_from(buf, end - _record.size)
+        if seq <= after:
+            break
+        end -= _record.size + size
+        changes.append(_loads(buf[end : end + size]))
+    changes.reverse()
+    return changes
+
+
+def loader_nonlock(memblock, oldhash):
+    payloadlen, seq, snapseq, logstart, logend, gen, snapstart = _header.unpack_from(
+        memblock.buf
+    )
+    if seq == oldhash:
+        return None, seq
+    buffers = _read_buffers(memblock.buf, snapstart + payloadlen)
+    it = _loads(memblock.buf[snapstart : snapstart + payloadlen], buffers)
+    for name, args in _read_journal(memblock.buf, logstart, logend, snapseq):
+        getattr(type(it), name)(it, *args)
+    return it, seq
+
+
+def journal_loader_nonlock(memblock, oldhash):
+    # changes made after oldhash as [(method name, args), ...],
+    # None if they are not all in the journal anymore
+    payloadlen, seq, snapseq, logstart, logend = _header.unpack_from(memblock.buf)[:5]
+    if not snapseq <= oldhash <= seq:
+        return None, seq
+    return _read_journal(memblock.buf, logstart, logend, oldhash), seq
+
+
+class _BlockFullError(ValueError):
+    @property
+    def needed(self):
+        return self.args[1]
+
+
+class _SharedBufWriter:
+    # File-like target that lets the pickler write straight into the shared block.
+    # Each thread keeps one writer together with its pickler between writes, see
+    # _take_writer, so a write doesn't have to allocate a new pickler every time.
+    def __init__(self):
+        self.protocol = cfg.protocol
+        self.pickler = pickle.Pickler(
+            self,
+            protocol=self.protocol,
+            buffer_callback=self._add_buffer if self.protocol >= 5 else None,
+        )
+        self.pickler.dispatch_table = _dispatch_table
+        self.release()
+
+    def reset(self, memblock, offset, out_of_band=True, limit=None):
+        # without a memblock the writer only counts the bytes (see _measure),
+        # limit is where the free space the writer may use ends
+        self.memblock = memblock
+        self.buf = memblock.buf if memblock is not None else None
+        if limit is None and self.buf is not None:
+            limit = self.buf.nbytes
+        self.limit = limit
+        self.start = self.pos = offset
+        self.out_of_band = out_of_band
+        self.buffers = []
+
+    def release(self):
+        self.memblock = self.buf = None
+        self.buffers = []
+
+    def _add_buffer(self, buffer):
+        # a false return value makes the buffer out-of-band
+        if not self.out_of_band:
+            return True
+        self.buffers.append(buffer)
+        return False
+
+    def write(self, data):
+        if type(data) is not bytes:
+            data = memoryview(data).cast("B")
+        size = len(data)
+        end = self.pos + size
+        if self.buf is not None:
+            if end > self.limit:
+                raise _BlockFullError(
+                    f"Shared memory block {self.memblock.name!r} is too small: "
+                    f"at least {end} bytes needed, {self.limit} available",
+                    end,
+                )
+            self.buf[self.pos : end] = data
+        self.pos = end
+        return size
+
+    def rewind(self):
+        self.pos = self.start
+        self.buffers = []
+
+
+_tls = threading.local()
+
+
+def _take_writer(memblock, offset, out_of_band=True, limit=None):
+    # a writer still in use further up the stack isn't in _tls, a new one is made then
+    writer = _tls.__dict__.pop("writer", None)
+    if writer is None or writer.protocol != cfg.protocol:
+        writer = _SharedBufWriter()
+    writer.reset(memblock, offset, out_of_band, limit)
+    return writer
+
+
+def _put_writer(writer):
+    writer.release()
+    _tls.writer = writer
+
+
+# The shared containers are stored as plain dict / list / set. The reducers stream
+# the items straight out of the instance instead of pickling a copy of it.
+def _reduce_shared_dict(d):
+    return dict, (), None, None, iter(dict.items(d))
+
+
+def _reduce_shared_list(l):
+    return list, (), None, list.__iter__(l)
+
+
+def _reduce_shared_set(s):
+    return set, (set.copy(s),)
+
+
+def _dill_dump(it, file):
+    pickler = dill.Pickler(file, protocol=cfg.protocol, recurse=True)
+    pickler.dispatch_table = _dispatch_table
+    pickler.dump(it)
+
+
+def _values(it):
+    # the keys and values of a container, tuples (like journal records) are looked into
+    if isinstance(it, dict):
+        return itertools.chain(dict.keys(it), dict.values(it))
+    if isinstance(it, list):
+        return list.__iter__(it)
+    if isinstance(it, set):
+        return set.__iter__(it)
+    if type(it) is tuple:
+        return itertools.chain.from_iterable(
+            _values(v) if type(v) is tuple else (v,) for v in it
+        )
+    return ()
+
+
+def _holds_dill_only(it, seen):
+    # looks through nested containers the same way _learn_dill_only does
+    seen.add(id(it))
+    for value in _values(it):
+        t = type(value)
+        if t in _dill_only_types:
+            return True
+        if (
+            t not in _IMMUTABLE_TYPES
+            and isinstance(value, (dict, list, set, tuple))
+            and id(value) not in seen
+            and _holds_dill_only(value, seen)
+        ):
+            return True
+    return False
+
+
+def _needs_dill(it):
+    if type(it) is _DICT_ITEMS_TYPE:
+        return True
+    if id(it) in _dill_only_objects:
+        return True
+    if not _dill_only_types:
+        return False
+    return _holds_dill_only(it, set())
+
+
+def _pickles(value):
+    # whether the stdlib pickler of _dump takes value, the writer only counts bytes
+    writer = _take_writer(None, 0)
+    try:
+        writer.pickler.dump(value)
+    except Exception:
+        return False
+    finally:
+        writer.pickler.clear_memo()
+        _put_writer(writer)
+    return True
+
+
+def _learn_dill_only(it, seen=None):
+    # remembers the types of the keys and values pickle refuses, so the next write
+    # of a container holding such a value goes to dill right away. Refused
+    # containers are looked into, only the types of the values inside are
+    # remembered. Returns whether a new type was remembered.
+    seen = set() if seen is None else seen
+    seen.add(id(it))
+    learned = False
+    for value in _values(it):
+        if id(value) in seen or _pickles(value):
+            continue
+        if isinstance(value, (dict, list, set, tuple)):
+            learned = _learn_dill_only(value, seen) or learned
+        elif type(value) not in _dill_only_types:
+            if len(_dill_only_types) < _DILL_ONLY_MAX:
+                _dill_only_types.add(type(value))
+                learned = True
+    return learned
+
+
+def _remember_dill_only(it):
+    # nothing to learn from it, so it goes to dill without trying pickle again
+    try:
+        _dill_only_objects[id(it)] = it
+    except TypeError:  # no weak references to tuples, like journal records
+        pass
+
+
+def _dump(it, writer):
+    try:
+        if _needs_dill(it):
+            _dill_dump(it, writer)
         else:
-            asdill = pickle.dumps(it, protocol=cfg.protocol)
+            try:
+                writer.pickler.dump(it)
+            finally:
+                writer.pickler.clear_memo()
+    except _BlockFullError:
+        raise
     except Exception as e:
-        asdill = dill.dumps(it, recurse=True, protocol=cfg.protocol)
-    memblock.buf[: len(asdill)] = asdill
-    return hash(asdill)
+        writer.rewind()
+        if not _learn_dill_only(it):
+            _remember_dill_only(it)
+        _dill_dump(it, writer)
+    return writer.buffers
+
+
+def _measure(it):
+    # bytes update_nonlock needs to store it
+    writer = _take_writer(None, HEADER_SIZE)
+    buffers = _dump(it, writer)
+    size = writer.pos + _buflen.size
+    size += sum(_buflen.size + b.raw().nbytes for b in buffers)
+    _put_writer(writer)
+    return size
+
+
+def update_nonlock(memblock, it):
+    # The new snapshot goes into the larger free space, after the journal or in
+    # front of the current snapshot, and only the header switches readers over to
+    # it. A failed write leaves the current snapshot and journal untouched.
+    seq, snapseq, logstart, logend, gen, snapstart = _header.unpack_from(
+        memblock.buf
+    )[1:]
+    logend = max(logend, HEADER_SIZE)
+    if snapstart - HEADER_SIZE > memblock.buf.nbytes - logend:
+        start, limit = HEADER_SIZE, snapstart
+    else:
+        start, limit = logend, None
+    writer = _take_writer(memblock, start, limit=limit)
+    buffers = _dump(it, writer)
+    payloadlen = writer.pos - start
+    writer.write(_buflen.pack(len(buffers)))
+    for b in buffers:
+        raw = b.raw()
+        writer.write(_buflen.pack(raw.nbytes))
+        writer.write(raw)
+    seq += 1
+    _header.pack_into(
+        memblock.buf, 0, payloadlen, seq, seq, writer.pos, writer.pos, gen, start
+    )
+    _put_writer(writer)
+    return seq
+
+
+def close_memory_blocks(root, blocks, unlink=False):
+    # closes root and the generations in blocks, unlink also removes root and
+    # the current generation (the older ones were unlinked when the data moved)
+    gen = _gen.unpack_from(root.buf)[0]
+    for memblock in blocks:
+        if memblock is not root:
+            memblock.close()
+    root.close()
+    if unlink:
+        _unlink_block(root)
+        if gen:
+            try:
+                current = open_generation(root, gen)
+            except FileNotFoundError:
+                return
+            current.close()
+            _unlink_block(current)
+
 
+# write_behind instances with unwritten changes, kept alive until they are written
+_write_behind = {}
 
-@lock
-def update(memblock, it):
+
+@atexit.register
+def _flush_write_behind():
+    for it in list(_write_behind.values()):
+        it.flush()
+
+
+def _write_behind_loop(ref, signals):
+    # writes the changes of the instance behind ref once for all signals queued
+    # while it was busy, until it gets None (or the instance is gone)
+    while signals.get():
+        try:
+            while True:
+                if not signals.get_nowait():
+                    return
+        except queue.Empty:
+            pass
+        it = ref()
+        if it is None:
+            return
+        try:
+            it._memwritesignalled()
+        except Exception as e:
+            sys.stderr.write(f"Failed to write {it._memname!r}: {e}\n")
+            sys.stderr.flush()
+        del it
+
+
+def start_write_behind(it):
+    signals = queue.SimpleQueue()
+    thread = threading.Thread(
+        target=_write_behind_loop, args=(weakref.ref(it), signals), daemon=True
+    )
+    thread.start()
+    # an instance dropped without cleanup() stops its thread too
+    stop = weakref.finalize(it, signals.put, None)
+    return signals, thread, stop
+
+
+def stop_write_behind(writer):
+    signals, thread, stop = writer
+    stop()
+    if thread is not threading.current_thread():
+        thread.join()
+
+
+def update_growing_nonlock(root, memblock, it):
+    # update_nonlock, moving the data to bigger generations until it fits.
+    # Returns the seqno and the block the data is in now.
+    gen = 0 if memblock is root else _gen.unpack_from(memblock.buf)[0]
+    if gen != _gen.unpack_from(root.buf)[0]:
+        # nobody reads it anymore, and its successor's name is taken
+        raise ValueError(
+            f"Shared memory block {memblock.name!r} is not the current "
+            f"generation of {root.name!r}"
+        )
+    start = memblock
+    while True:
+        try:
+            return update_nonlock(memblock, it), memblock
+        except _BlockFullError as e:
+            new = grow_memory_block(
+                root, memblock, max(_block_size(e.needed), 2 * memblock.size)
+            )
+        if memblock is not root:
+            _unlink_block(memblock)
+            if memblock is not start:
+                memblock.close()
+        memblock = new
+
+
+def journal_nonlock(memblock, name, *args):
+    # Appends a single change instead of rewriting the whole container. Returns
+    # None if it doesn't fit or the journal has grown larger than the snapshot,
+    # the caller has to write a new snapshot with update_nonlock then.
+    header = _header.unpack_from(memblock.buf)
+    payloadlen, seq, snapseq, logstart, logend = header[:5]
+    writer = _take_writer(memblock, logend, out_of_band=False)
+    seq += 1
     try:
-        if str(it.__class__) == "<class 'dict_items'>":
-            asdill = dill.dumps(it, recurse=True, protocol=cfg.protocol)
+        _dump((name, args), writer)
+        writer.write(_record.pack(seq, writer.pos - logend))
+    except _BlockFullError:
+        return None
+    logend = writer.pos
+    _put_writer(writer)
+    if logend - logstart > payloadlen:
+        return None
+    _header.pack_into(
+        memblock.buf, 0, payloadlen, seq, snapseq, logstart, logend, *header[5:]
+    )
+    return seq
+
+
+class _MemShared:
+    # The shared memory side of MemSharedDict, MemSharedList and MemSharedSet: these
+    # put the mixin in front of dict / list / set, so super() here is the builtin.
+    def __init__(
+        self, initialdata=None, /, name=None, size=None, write_behind=None, **kwargs
+    ):
+        self._memsize = size
+        self._memname = name if name is not None else str(time.time())
+        self._memlock = get_memlock(self._memname)
+        self._memtxn = False
+        self._memdirty = False
+        self._memwritebehind = (
+            cfg.write_behind if write_behind is None else write_behind
+        )
+        self._mempending = False
+        self._memsignalled = False
+        self._memwriter = None
+        self._memgen = 0
+        self._memretired = []
+        if initialdata:
+            super().__init__(initialdata, **kwargs)
+        with self._memlock:
+            self._memshared, self._mem_exists = get_or_create_memory_block(
+                self._memname, self._memsize, newval=self
+            )
+            self._memroot = self._memshared
+            self._memsize = self._memshared.size
+            self._memhashold = 0
+            if self._mem_exists:
+                self._memloader_nonlock()
+            else:
+                self._memhashold = _seqno.unpack_from(self._memshared.buf)[0]
+
+    @contextmanager
+    def transaction(self):
+        # holds the lock, loads once and writes once (if anything changed) for all
+        # operations inside the with block. _memtxn is tested under the lock: only
+        # the thread holding it can be inside a transaction of this instance
+        with self._memlock:
+            if self._memtxn:
+                yield self
+                return
+            self._memloader_nonlock()
+            self._memtxn = True
+            try:
+                yield self
+            finally:
+                self._memtxn = False
+                if self._memdirty:
+                    self._memdirty = False
+                    self._memupdater_nonlock()
+
+    def _memloader(self):
+        # nothing changed since our last load or write: skip the lock and the load
+        if cfg.single_process:
+            return
+        if _seqno.unpack_from(self._memshared.buf)[0] != self._memhashold:
+            with self._memlock:
+                self._memloader_nonlock()
+
+    def _memloader_nonlock(self):
+        # unwritten changes of write_behind would be lost by a load
+        if self._memtxn or self._mempending:
+            return
+        self._memfollow()
+        changes, seq = journal_loader_nonlock(self._memshared, self._memhashold)
+        if changes is not None:
+            for name, args in changes:
+                getattr(super(), name)(*args)
+            self._memhashold = seq
+            return
+        tmp, self._memhashold = loader_nonlock(self._memshared, self._memhashold)
+        if tmp is not None:
+            # dict / list / set.__init__ fill the emptied container
+            super().clear()
+            super().__init__(tmp)
+
+    def _memupdater_nonlock(self):
+        if self._memtxn:
+            self._memdirty = True
+            return
+        if self._memwritebehind:
+            self._memwritelater()
+            return
+        self._memwrite_nonlock()
+
+    def _memwrite_nonlock(self):
+        self._memhashold, memblock = update_growing_nonlock(
+            self._memroot, self._memshared, self
+        )
+        if memblock is not self._memshared:
+            self._memswitch(memblock, _gen.unpack_from(self._memroot.buf)[0])
+
+    def _memwritelater(self):
+        # a single signal per background write: the pending changes are written
+        # together. _memsignalled is reset before each write, a change made after
+        # a failed one signals again.
+        self._mempending = True
+        _write_behind[id(self)] = self
+        if self._memsignalled:
+            return
+        self._memsignalled = True
+        if self._memwriter is None or not self._memwriter[1].is_alive():
+            self._memwriter = start_write_behind(self)
+        self._memwriter[0].put(True)
+
+    def _memwritesignalled(self):
+        # called by the write behind thread
+        with self._memlock:
+            self._memsignalled = False
+            self.flush()
+
+    def flush(self):
+        with self._memlock:
+            if self._mempending:
+                # the loads were skipped, the data may have moved meanwhile
+                self._memfollow()
+                self._memwrite_nonlock()
+                self._mempending = False
+                _write_behind.pop(id(self), None)
+
+    def _memfollow(self):
+        # another instance moved the data to a bigger block
+        gen = _gen.unpack_from(self._memroot.buf)[0]
+        if gen != self._memgen:
+            self._memswitch(open_generation(self._memroot, gen), gen)
+
+    def _memswitch(self, memblock, gen):
+        # the old block stays mapped until cleanup(), other threads may still read
+        # its seqno in _memloader
+        if self._memshared is not self._memroot:
+            self._memretired.append(self._memshared)
+        self._memshared = memblock
+        self._memgen = gen
+        self._memsize = memblock.size
+
+    def _memjournal_nonlock(self, key, name, *args):
+        # journals the change super().name(*args) if the key (or index) it is
+        # addressed by survives pickling, writes a new snapshot otherwise
+        if self._memtxn:
+            self._memdirty = True
+            return
+        if self._memwritebehind:
+            self._memwritelater()
+            return
+        seq = None
+        if type(key) in _JOURNAL_KEY_TYPES:
+            seq = journal_nonlock(self._memshared, name, *args)
+        if seq is None:
+            self._memupdater_nonlock()
         else:
-            asdill = pickle.dumps(it, protocol=cfg.protocol)
-    except Exception as e:
-        asdill = dill.dumps(it, recurse=True, protocol=cfg.protocol)
-    memblock.buf[: len(asdill)] = asdill
-    return hash(asdill)
+            self._memhashold = seq
 
+    def cleanup(self):
+        if self._memwriter is not None:
+            self.flush()
+            stop_write_behind(self._memwriter)
+            self._memwriter = None
+        close_memory_blocks(
+            self._memroot,
+            [self._memshared, *self._memretired],
+            unlink=not self._mem_exists,
+        )
+        # drop the closed blocks right away instead of waiting for a gc run
+        self._memshared = self._memroot = None
+        self._memretired.clear()
+        if not self._mem_exists:
+            self._memlock.unlink()
 
-class MemSharedDict(dict):
+
+class MemSharedDict(_MemShared, dict):
     r"""
     MemSharedDict: A shared memory dictionary with locking support.
 
@@ -115,27 +821,44 @@ class MemSharedDict(dict):
     common dictionary, and a locking mechanism is provided to ensure data consistency.
 
     Initialization:
-        MemSharedDict(initialdata=None, /, name=None, size=1024 * 1000, **kwargs)
+        MemSharedDict(initialdata=None, /, name=None, size=None, write_behind=None, **kwargs)
 
     Parameters:
         - initialdata (optional): Initial data to populate the shared dictionary.
         - name (optional): A unique name for identifying the shared memory block.
-        - size (optional): Size of the shared memory block in bytes.
+        - size (optional): Initial size of the shared memory block in bytes, by default
+          derived from the initial data. The data moves to a bigger block when it outgrows it.
+        - write_behind (optional): Write changes to the shared memory block in a background
+          thread instead of in the modifying call, default cfg.write_behind. Changes made by
+          others are not loaded while this instance has unwritten ones, the last writer wins.
         - **kwargs: Additional keyword arguments supported by the underlying Python dictionary.
 
     Attributes:
         - _memsize: Size of the shared memory block.
         - _memname: Name of the shared memory block.
-        - _memshared: Shared memory block instance.
+        - _memshared: Shared memory block instance holding the current generation of the data.
+        - _memroot, _memgen: First shared memory block (see grow_memory_block) and the
+          generation in _memshared.
         - _mem_exists: Boolean indicating whether the shared memory block already exists.
-        - _memhashold: Hash value representing the state of the shared memory block.
+        - _memhashold: Sequence number of the shared memory block state last seen by this instance.
+        - _memtxn, _memdirty: Whether a transaction() is running and whether it changed anything.
+        - _memlock: Lock shared by all users of the shared memory block (see get_memlock).
+        - _memwritebehind, _mempending, _memwriter: Whether changes are written in the
+          background, whether some are not written yet and the queue / thread writing them.
+        - _memsignalled: Whether the write behind thread has been asked to write already.
 
     Methods:
-        - _load_mem(func): Decorator for loading data from the shared memory block before executing a method.
-        - _update_mem(func): Decorator for updating data in the shared memory block after executing a method.
         - _memloader(): Loads data from the shared memory block into the dictionary.
-        - _memupdater(): Updates data in the shared memory block based on the current state of the dictionary.
+        - _memloader_nonlock(): The same without taking the lock.
+        - _memupdater_nonlock(): Updates data in the shared memory block based on the current state
+          of the dictionary, used by mutating methods which hold the lock for the whole
+          load / modify / update cycle.
+        - _memjournal_nonlock(key, name, *args): Records a single change in the journal of the
+          shared memory block instead of rewriting all of it.
         - cleanup(): close the shared memory
+        - transaction(): Context manager that holds the lock and loads / writes the shared
+          memory block only once for all operations inside the with block.
+        - flush(): Writes the changes the background thread of write_behind hasn't written yet.
 
     Inherited Methods from dict:
         - clear, copy, get, items, keys, pop, popitem, setdefault, update, values, etc.
@@ -144,220 +867,192 @@ class MemSharedDict(dict):
     for shared memory handling and pickle/dill for serialization.
     """
 
-    def __init__(self, initialdata=None, /, name=None, size=1024 * 1000, **kwargs):
-        self._memsize = size
-        self._memname = name if name is not None else str(time.time())
-        self._memshared, self._mem_exists = get_or_create_memory_block(
-            self._memname, self._memsize, newval={}.items()
-        )
-        self._memhashold = 0
-        if initialdata:
-            super().__init__(initialdata, **kwargs)
-        if self._mem_exists:
-            self._memloader()
-        else:
-            self._memhashold = update_nonlock(
-                memblock=self._memshared, it=initialdata.items() if initialdata else {}
-            )
-
-    def _load_mem(func):
-        def wrapper(self, *arg, **kw):
-            self._memloader()
-            res = func(self, *arg, **kw)
-            return res
-
-        return wrapper
-
     def to_dict(self):
-        return {k: v for k, v in self.items()}
-
-    def _update_mem(func):
-        def wrapper(self, *arg, **kw):
-            res = func(self, *arg, **kw)
-            self._memupdater()
-            return res
-
-        return wrapper
-
-    def _memloader(self):
-        tmp, self._memhashold = loader(self._memshared, self._memhashold)
-        if tmp is not None:
-            super().clear()
-            super().update(tmp)
+        self._memloader()
+        return super().copy()
 
-    def _memupdater(self):
-        try:
-            self._memhashold = update(memblock=self._memshared, it=self.items())
-        except Exception as e:
-            sys.stderr.write(f"Failed to activate lock - trying without it\n")
-            sys.stderr.flush()
-            self._memhashold = update_nonlock(memblock=self._memshared, it=self.items())
-
-    @_load_mem
     def __class_getitem__(self, *args, **kwargs):
+        self._memloader()
         return super().__class_getitem__(*args, **kwargs)
 
-    @_load_mem
     def __contains__(self, *args, **kwargs):
+        self._memloader()
         return super().__contains__(*args, **kwargs)
 
-    def cleanup(self):
-        self._memshared.close()
-        if not self._mem_exists:
-            self._memshared.unlink()
-            gc.collect()
-        # return super().__del__(*args, **kwargs)
-
-    @_load_mem
-    @_update_mem
-    def __delitem__(self, *args, **kwargs):
-        return super().__delitem__(*args, **kwargs)
+    def __delitem__(self, key):
+        with self._memlock:
+            self._memloader_nonlock()
+            res = super().__delitem__(key)
+            self._memjournal_nonlock(key, "__delitem__", key)
+        return res
 
-    @_load_mem
     def __eq__(self, *args, **kwargs):
+        self._memloader()
         return super().__eq__(*args, **kwargs)
 
-    @_load_mem
     def __format__(self, *args, **kwargs):
+        self._memloader()
         return super().__format__(*args, **kwargs)
 
-    @_load_mem
     def __ge__(self, *args, **kwargs):
+        self._memloader()
         return super().__ge__(*args, **kwargs)
 
-    @_load_mem
     def __getitem__(self, *args, **kwargs):
+        self._memloader()
         return super().__getitem__(*args, **kwargs)
 
-    @_load_mem
     def __getstate__(self, *args, **kwargs):
+        self._memloader()
         return super().__getstate__(*args, **kwargs)
 
-    @_load_mem
     def __gt__(self, *args, **kwargs):
+        self._memloader()
         return super().__gt__(*args, **kwargs)
 
-    @_load_mem
     def __hash__(self, *args, **kwargs):
+        self._memloader()
         return super().__hash__(*args, **kwargs)
 
-    @_load_mem
     def __init_subclass__(self, *args, **kwargs):
+        self._memloader()
         return super().__init_subclass__(*args, **kwargs)
 
-    @_load_mem
-    @_update_mem
     def __ior__(self, *args, **kwargs):
-        return super().__ior__(*args, **kwargs)
+        with self._memlock:
+            self._memloader_nonlock()
+            res = super().__ior__(*args, **kwargs)
+            self._memupdater_nonlock()
+        return res
 
-    @_load_mem
     def __iter__(self, *args, **kwargs):
+        self._memloader()
         return super().__iter__(*args, **kwargs)
 
-    @_load_mem
     def __le__(self, *args, **kwargs):
+        self._memloader()
         return super().__le__(*args, **kwargs)
 
-    @_load_mem
     def __len__(self, *args, **kwargs):
+        self._memloader()
         return super().__len__(*args, **kwargs)
 
-    @_load_mem
     def __lt__(self, *args, **kwargs):
+        self._memloader()
         return super().__lt__(*args, **kwargs)
 
-    @_load_mem
     def __ne__(self, *args, **kwargs):
+        self._memloader()
         return super().__ne__(*args, **kwargs)
 
-    @_load_mem
     def __or__(self, *args, **kwargs):
+        self._memloader()
         return super().__or__(*args, **kwargs)
 
-    @_load_mem
     def __reduce__(self, *args, **kwargs):
+        self._memloader()
         return super().__reduce__(*args, **kwargs)
 
-    @_load_mem
     def __reduce_ex__(self, *args, **kwargs):
+        self._memloader()
         return super().__reduce_ex__(*args, **kwargs)
 
-    @_load_mem
     def __repr__(self, *args, **kwargs):
+        self._memloader()
         return super().__repr__(*args, **kwargs)
 
-    @_load_mem
     def __reversed__(self, *args, **kwargs):
+        self._memloader()
         return super().__reversed__(*args, **kwargs)
 
-    @_load_mem
     def __ror__(self, *args, **kwargs):
+        self._memloader()
         return super().__ror__(*args, **kwargs)
 
-    @_load_mem
-    @_update_mem
-    def __setitem__(self, *args, **kwargs):
-        return super().__setitem__(*args, **kwargs)
+    def __setitem__(self, key, value):
+        with self._memlock:
+            self._memloader_nonlock()
+            old = super().get(key, _MISSING)
+            res = super().__setitem__(key, value)
+            if not _same_value(old, value):
+                self._memjournal_nonlock(key, "__setitem__", key, value)
+        return res
 
-    @_load_mem
     def __sizeof__(self, *args, **kwargs):
+        self._memloader()
         return super().__sizeof__(*args, **kwargs)
 
-    @_load_mem
     def __str__(self, *args, **kwargs):
+        self._memloader()
         return super().__str__(*args, **kwargs)
 
-    @_load_mem
     def __subclasshook__(self, *args, **kwargs):
+        self._memloader()
         return super().__subclasshook__(*args, **kwargs)
 
-    @_load_mem
-    @_update_mem
     def clear(self, *args, **kwargs):
-        return super().clear(*args, **kwargs)
+        with self._memlock:
+            self._memloader_nonlock()
+            size = super().__len__()
+            res = super().clear(*args, **kwargs)
+            if super().__len__() != size:
+                self._memupdater_nonlock()
+        return res
 
-    @_load_mem
     def copy(self, *args, **kwargs):
+        self._memloader()
         return super().copy(*args, **kwargs)
 
-    @_load_mem
     def get(self, *args, **kwargs):
+        self._memloader()
         return super().get(*args, **kwargs)
 
-    @_load_mem
     def items(self, *args, **kwargs):
+        self._memloader()
         return super().items(*args, **kwargs)
 
-    @_load_mem
     def keys(self, *args, **kwargs):
+        self._memloader()
         return super().keys(*args, **kwargs)
 
-    @_load_mem
-    @_update_mem
-    def pop(self, *args, **kwargs):
-        return super().pop(*args, **kwargs)
-
-    @_load_mem
-    @_update_mem
-    def popitem(self, *args, **kwargs):
-        return super().popitem(*args, **kwargs)
-
-    @_load_mem
-    @_update_mem
-    def setdefault(self, *args, **kwargs):
-        return super().setdefault(*args, **kwargs)
+    def pop(self, key, *args):
+        with self._memlock:
+            self._memloader_nonlock()
+            size = super().__len__()
+            res = super().pop(key, *args)
+            if super().__len__() != size:
+                self._memjournal_nonlock(key, "__delitem__", key)
+        return res
+
+    def popitem(self):
+        with self._memlock:
+            self._memloader_nonlock()
+            res = super().popitem()
+            self._memjournal_nonlock(res[0], "__delitem__", res[0])
+        return res
+
+    def setdefault(self, key, default=None):
+        with self._memlock:
+            self._memloader_nonlock()
+            size = super().__len__()
+            res = super().setdefault(key, default)
+            if super().__len__() != size:
+                self._memjournal_nonlock(key, "__setitem__", key, default)
+        return res
 
-    @_load_mem
-    @_update_mem
     def update(self, *args, **kwargs):
-        return super().update(*args, **kwargs)
+        with self._memlock:
+            self._memloader_nonlock()
+            res = super().update(*args, **kwargs)
+            self._memupdater_nonlock()
+        return res
 
-    @_load_mem
     def values(self, *args, **kwargs):
+        self._memloader()
         return super().values(*args, **kwargs)
 
 
-class MemSharedList(list):
+class MemSharedList(_MemShared, list):
     r"""
     MemSharedList: A shared memory list with locking support.
 
@@ -367,27 +1062,44 @@ class MemSharedList(list):
     and a locking mechanism is provided to ensure data consistency.
 
     Initialization:
-        MemSharedList(initialdata=None, name=None, size=1024 * 1000, **kwargs)
+        MemSharedList(initialdata=None, name=None, size=None, write_behind=None, **kwargs)
 
     Parameters:
         - initialdata (optional): Initial data to populate the shared list.
         - name (optional): A unique name for identifying the shared memory block.
-        - size (optional): Size of the shared memory block in bytes.
+        - size (optional): Initial size of the shared memory block in bytes, by default
+          derived from the initial data. The data moves to a bigger block when it outgrows it.
+        - write_behind (optional): Write changes to the shared memory block in a background
+          thread instead of in the modifying call, default cfg.write_behind. Changes made by
+          others are not loaded while this instance has unwritten ones, the last writer wins.
         - **kwargs: Additional keyword arguments supported by the underlying Python list.
 
     Attributes:
         - _memsize: Size of the shared memory block.
         - _memname: Name of the shared memory block.
-        - _memshared: Shared memory block instance.
+        - _memshared: Shared memory block instance holding the current generation of the data.
+        - _memroot, _memgen: First shared memory block (see grow_memory_block) and the
+          generation in _memshared.
         - _mem_exists: Boolean indicating whether the shared memory block already exists.
-        - _memhashold: Hash value representing the state of the shared memory block.
+        - _memhashold: Sequence number of the shared memory block state last seen by this instance.
+        - _memtxn, _memdirty: Whether a transaction() is running and whether it changed anything.
+        - _memlock: Lock shared by all users of the shared memory block (see get_memlock).
+        - _memwritebehind, _mempending, _memwriter: Whether changes are written in the
+          background, whether some are not written yet and the queue / thread writing them.
+        - _memsignalled: Whether the write behind thread has been asked to write already.
 
     Methods:
-        - _load_mem(func): Decorator for loading data from the shared memory block before executing a method.
-        - _update_mem(func): Decorator for updating data in the shared memory block after executing a method.
         - _memloader(): Loads data from the shared memory block into the list.
-        - _memupdater(): Updates data in the shared memory block based on the current state of the list.
+        - _memloader_nonlock(): The same without taking the lock.
+        - _memupdater_nonlock(): Updates data in the shared memory block based on the current state
+          of the list, used by mutating methods which hold the lock for the whole
+          load / modify / update cycle.
+        - _memjournal_nonlock(key, name, *args): Records a single change in the journal of the
+          shared memory block instead of rewriting all of it.
         - cleanup(): close the shared memory
+        - transaction(): Context manager that holds the lock and loads / writes the shared
+          memory block only once for all operations inside the with block.
+        - flush(): Writes the changes the background thread of write_behind hasn't written yet.
 
     Inherited Methods from list:
         - append, clear, copy, count, extend, index, insert, pop, remove, reverse, sort, etc.
@@ -395,238 +1107,212 @@ class MemSharedList(list):
     Note: This class utilizes multiprocessing.shared_memory.SharedMemory for shared memory
     handling and pickle/dill for serialization."""
 
-    def __init__(self, initialdata=None, /, name=None, size=1024 * 1000, **kwargs):
-        self._memsize = size
-        self._memname = name if name is not None else str(time.time())
-        self._memshared, self._mem_exists = get_or_create_memory_block(
-            self._memname, self._memsize, newval=[]
-        )
-        self._memhashold = 0
-        if initialdata:
-            super().__init__(initialdata, **kwargs)
-        if self._mem_exists:
-            self._memloader()
-        else:
-            self._memhashold = update_nonlock(
-                memblock=self._memshared,
-                it=[x for x in super().__iter__()] if initialdata else [],
-            )
-
     def to_list(self):
-        return [k for k in self.__iter__()]
-
-    def _load_mem(func):
-        def wrapper(self, *arg, **kw):
-            self._memloader()
-            res = func(self, *arg, **kw)
-            return res
-
-        return wrapper
-
-    def _update_mem(func):
-        def wrapper(self, *arg, **kw):
-            res = func(self, *arg, **kw)
-            self._memupdater()
-            return res
-
-        return wrapper
-
-    def _memloader(self):
-        tmp, self._memhashold = loader(self._memshared, self._memhashold)
-        if tmp is not None:
-            super().clear()
-            _ = [self.append(x) for x in tmp]
-
-    def _memupdater(self):
-        try:
-            self._memhashold = update(
-                memblock=self._memshared, it=[x for x in super().__iter__()]
-            )
-        except Exception as e:
-            sys.stderr.write(f"Failed to activate lock - trying without it\n")
-            sys.stderr.flush()
-            self._memhashold = update_nonlock(
-                memblock=self._memshared, it=[x for x in super().__iter__()]
-            )
+        self._memloader()
+        return super().copy()
 
-    @_load_mem
     def __add__(self, *args, **kwargs):
+        self._memloader()
         return super().__add__(*args, **kwargs)
 
-    @_load_mem
     def __class_getitem__(self, *args, **kwargs):
+        self._memloader()
         return super().__class_getitem__(*args, **kwargs)
 
-    @_load_mem
     def __contains__(self, *args, **kwargs):
+        self._memloader()
         return super().__contains__(*args, **kwargs)
 
-    @_load_mem
-    @_update_mem
-    def __delitem__(self, *args, **kwargs):
-        return super().__delitem__(*args, **kwargs)
+    def __delitem__(self, index):
+        with self._memlock:
+            self._memloader_nonlock()
+            res = super().__delitem__(index)
+            self._memjournal_nonlock(index, "__delitem__", index)
+        return res
 
-    def cleanup(
-        self,
-    ):
-        self._memshared.close()
-        if not self._mem_exists:
-            self._memshared.unlink()
-            gc.collect()
-
-    @_load_mem
     def __eq__(self, *args, **kwargs):
+        self._memloader()
         return super().__eq__(*args, **kwargs)
 
-    @_load_mem
     def __format__(self, *args, **kwargs):
+        self._memloader()
         return super().__format__(*args, **kwargs)
 
-    @_load_mem
     def __ge__(self, *args, **kwargs):
+        self._memloader()
         return super().__ge__(*args, **kwargs)
 
-    @_load_mem
     def __getitem__(self, *args, **kwargs):
+        self._memloader()
         return super().__getitem__(*args, **kwargs)
 
-    @_load_mem
     def __getstate__(self, *args, **kwargs):
+        self._memloader()
         return super().__getstate__(*args, **kwargs)
 
-    @_load_mem
     def __gt__(self, *args, **kwargs):
+        self._memloader()
         return super().__gt__(*args, **kwargs)
 
-    @_load_mem
     def __hash__(self, *args, **kwargs):
+        self._memloader()
         return super().__hash__(*args, **kwargs)
 
-    @_load_mem
-    @_update_mem
     def __iadd__(self, *args, **kwargs):
-        return super().__iadd__(*args, **kwargs)
+        with self._memlock:
+            self._memloader_nonlock()
+            size = super().__len__()
+            res = super().__iadd__(*args, **kwargs)
+            if super().__len__() != size:
+                self._memupdater_nonlock()
+        return res
 
-    @_load_mem
-    @_update_mem
     def __imul__(self, *args, **kwargs):
-        return super().__imul__(*args, **kwargs)
+        with self._memlock:
+            self._memloader_nonlock()
+            size = super().__len__()
+            res = super().__imul__(*args, **kwargs)
+            if super().__len__() != size:
+                self._memupdater_nonlock()
+        return res
 
-    @_load_mem
     def __init_subclass__(self, *args, **kwargs):
+        self._memloader()
         return super().__init_subclass__(*args, **kwargs)
 
-    @_load_mem
     def __iter__(self, *args, **kwargs):
+        self._memloader()
         return super().__iter__(*args, **kwargs)
 
-    @_load_mem
     def __le__(self, *args, **kwargs):
+        self._memloader()
         return super().__le__(*args, **kwargs)
 
-    @_load_mem
     def __len__(self, *args, **kwargs):
+        self._memloader()
         return super().__len__(*args, **kwargs)
 
-    @_load_mem
     def __lt__(self, *args, **kwargs):
+        self._memloader()
         return super().__lt__(*args, **kwargs)
 
-    @_load_mem
     def __mul__(self, *args, **kwargs):
+        self._memloader()
         return super().__mul__(*args, **kwargs)
 
-    @_load_mem
     def __ne__(self, *args, **kwargs):
+        self._memloader()
         return super().__ne__(*args, **kwargs)
 
-    @_load_mem
     def __reduce__(self, *args, **kwargs):
+        self._memloader()
         return super().__reduce__(*args, **kwargs)
 
-    @_load_mem
     def __reduce_ex__(self, *args, **kwargs):
+        self._memloader()
         return super().__reduce_ex__(*args, **kwargs)
 
-    @_load_mem
     def __repr__(self, *args, **kwargs):
+        self._memloader()
         return super().__repr__(*args, **kwargs)
 
-    @_load_mem
     def __reversed__(self, *args, **kwargs):
+        self._memloader()
         return super().__reversed__(*args, **kwargs)
 
-    @_load_mem
     def __rmul__(self, *args, **kwargs):
+        self._memloader()
         return super().__rmul__(*args, **kwargs)
 
-    @_load_mem
-    @_update_mem
-    def __setitem__(self, *args, **kwargs):
-        return super().__setitem__(*args, **kwargs)
+    def __setitem__(self, index, value):
+        with self._memlock:
+            self._memloader_nonlock()
+            res = super().__setitem__(index, value)
+            self._memjournal_nonlock(index, "__setitem__", index, value)
+        return res
 
-    @_load_mem
     def __sizeof__(self, *args, **kwargs):
+        self._memloader()
         return super().__sizeof__(*args, **kwargs)
 
-    @_load_mem
     def __str__(self, *args, **kwargs):
+        self._memloader()
         return super().__str__(*args, **kwargs)
 
-    @_load_mem
-    @_update_mem
-    def append(self, *args, **kwargs):
-        return super().append(*args, **kwargs)
+    def append(self, value):
+        with self._memlock:
+            self._memloader_nonlock()
+            res = super().append(value)
+            self._memjournal_nonlock(None, "append", value)
+        return res
 
-    @_load_mem
-    @_update_mem
     def clear(self, *args, **kwargs):
-        return super().clear(*args, **kwargs)
+        with self._memlock:
+            self._memloader_nonlock()
+            size = super().__len__()
+            res = super().clear(*args, **kwargs)
+            if super().__len__() != size:
+                self._memupdater_nonlock()
+        return res
 
-    @_load_mem
     def copy(self, *args, **kwargs):
+        self._memloader()
         return super().copy(*args, **kwargs)
 
-    @_load_mem
     def count(self, *args, **kwargs):
+        self._memloader()
         return super().count(*args, **kwargs)
 
-    @_load_mem
-    @_update_mem
     def extend(self, *args, **kwargs):
-        return super().extend(*args, **kwargs)
+        with self._memlock:
+            self._memloader_nonlock()
+            size = super().__len__()
+            res = super().extend(*args, **kwargs)
+            if super().__len__() != size:
+                self._memupdater_nonlock()
+        return res
 
-    @_load_mem
     def index(self, *args, **kwargs):
+        self._memloader()
         return super().index(*args, **kwargs)
 
-    @_load_mem
-    @_update_mem
-    def insert(self, *args, **kwargs):
-        return super().insert(*args, **kwargs)
+    def insert(self, index, value):
+        with self._memlock:
+            self._memloader_nonlock()
+            res = super().insert(index, value)
+            self._memjournal_nonlock(index, "insert", index, value)
+        return res
 
-    @_load_mem
-    @_update_mem
-    def pop(self, *args, **kwargs):
-        return super().pop(*args, **kwargs)
+    def pop(self, index=-1):
+        with self._memlock:
+            self._memloader_nonlock()
+            res = super().pop(index)
+            self._memjournal_nonlock(index, "pop", index)
+        return res
 
-    @_load_mem
-    @_update_mem
     def remove(self, *args, **kwargs):
-        return super().remove(*args, **kwargs)
+        with self._memlock:
+            self._memloader_nonlock()
+            res = super().remove(*args, **kwargs)
+            self._memupdater_nonlock()
+        return res
 
-    @_load_mem
-    @_update_mem
     def reverse(self, *args, **kwargs):
-        return super().reverse(*args, **kwargs)
+        with self._memlock:
+            self._memloader_nonlock()
+            res = super().reverse(*args, **kwargs)
+            self._memupdater_nonlock()
+        return res
 
-    @_load_mem
-    @_update_mem
     def sort(self, *args, **kwargs):
-        return super().sort(*args, **kwargs)
+        with self._memlock:
+            self._memloader_nonlock()
+            res = super().sort(*args, **kwargs)
+            self._memupdater_nonlock()
+        return res
 
 
-class MemSharedSet(set):
+class MemSharedSet(_MemShared, set):
     r"""
     MemSharedSet: A shared memory set with locking support.
 
@@ -635,290 +1321,301 @@ class MemSharedSet(set):
     processes need to read and update a common set, and a locking mechanism is provided to ensure data consistency.
 
     Initialization:
-        MemSharedSet(initialdata=None, name=None, size=1024 * 1000, **kwargs)
+        MemSharedSet(initialdata=None, name=None, size=None, write_behind=None, **kwargs)
 
     Parameters:
         - initialdata (optional): Initial data to populate the shared set.
         - name (optional): A unique name for identifying the shared memory block.
-        - size (optional): Size of the shared memory block in bytes.
+        - size (optional): Initial size of the shared memory block in bytes, by default
+          derived from the initial data. The data moves to a bigger block when it outgrows it.
+        - write_behind (optional): Write changes to the shared memory block in a background
+          thread instead of in the modifying call, default cfg.write_behind. Changes made by
+          others are not loaded while this instance has unwritten ones, the last writer wins.
         - **kwargs: Additional keyword arguments supported by the underlying Python set.
 
     Attributes:
         - _memsize: Size of the shared memory block.
         - _memname: Name of the shared memory block.
-        - _memshared: Shared memory block instance.
+        - _memshared: Shared memory block instance holding the current generation of the data.
+        - _memroot, _memgen: First shared memory block (see grow_memory_block) and the
+          generation in _memshared.
         - _mem_exists: Boolean indicating whether the shared memory block already exists.
-        - _memhashold: Hash value representing the state of the shared memory block.
+        - _memhashold: Sequence number of the shared memory block state last seen by this instance.
+        - _memtxn, _memdirty: Whether a transaction() is running and whether it changed anything.
+        - _memlock: Lock shared by all users of the shared memory block (see get_memlock).
+        - _memwritebehind, _mempending, _memwriter: Whether changes are written in the
+          background, whether some are not written yet and the queue / thread writing them.
+        - _memsignalled: Whether the write behind thread has been asked to write already.
 
     Methods:
-        - _load_mem(func): Decorator for loading data from the shared memory block before executing a method.
-        - _update_mem(func): Decorator for updating data in the shared memory block after executing a method.
         - _memloader(): Loads data from the shared memory block into the set.
-        - _memupdater(): Updates data in the shared memory block based on the current state of the set.
+        - _memloader_nonlock(): The same without taking the lock.
+        - _memupdater_nonlock(): Updates data in the shared memory block based on the current state
+          of the set, used by mutating methods which hold the lock for the whole
+          load / modify / update cycle.
+        - _memjournal_nonlock(key, name, *args): Records a single change in the journal of the
+          shared memory block instead of rewriting all of it.
         - cleanup(): close the shared memory
+        - transaction(): Context manager that holds the lock and loads / writes the shared
+          memory block only once for all operations inside the with block.
+        - flush(): Writes the changes the background thread of write_behind hasn't written yet.
     Inherited Methods from set:
         - add, clear, copy, difference, difference_update, discard, intersection, intersection_update, isdisjoint, issubset, issuperset, pop, remove, symmetric_difference, symmetric_difference_update, union, update, etc.
 
     Note: This class utilizes multiprocessing.shared_memory.SharedMemory for shared memory handling
     and pickle/dill for serialization."""
 
-    def __init__(self, initialdata=None, /, name=None, size=1024 * 1000, **kwargs):
-        self._memsize = size
-        self._memname = name if name is not None else str(time.time())
-        self._memshared, self._mem_exists = get_or_create_memory_block(
-            self._memname, self._memsize, newval=set()
-        )
-        self._memhashold = 0
-        if initialdata:
-            super().__init__(initialdata, **kwargs)
-        if self._mem_exists:
-            self._memloader()
-        else:
-            self._memhashold = update_nonlock(
-                memblock=self._memshared,
-                it={x for x in super().__iter__()} if initialdata else set(),
-            )
-
     def to_set(self):
-        return {k for k in self.__iter__()}
-
-    def _load_mem(func):
-        def wrapper(self, *arg, **kw):
-            self._memloader()
-            res = func(self, *arg, **kw)
-            return res
-
-        return wrapper
+        self._memloader()
+        return super().copy()
 
-    def _update_mem(func):
-        def wrapper(self, *arg, **kw):
-            res = func(self, *arg, **kw)
-            self._memupdater()
-            return res
-
-        return wrapper
-
-    def _memloader(self):
-        tmp, self._memhashold = loader(self._memshared, self._memhashold)
-        if tmp is not None:
-            super().clear()
-            self.update(tmp)
-
-    def _memupdater(self):
-        try:
-            self._memhashold = update(
-                memblock=self._memshared, it={x for x in super().__iter__()}
-            )
-        except Exception as e:
-            sys.stderr.write(f"Failed to activate lock - trying without it\n")
-            sys.stderr.flush()
-            self._memhashold = update_nonlock(
-                memblock=self._memshared, it={x for x in super().__iter__()}
-            )
-
-    @_load_mem
     def __and__(self, *args, **kwargs):
+        self._memloader()
         return super().__and__(*args, **kwargs)
 
-    @_load_mem
     def __class_getitem__(self, *args, **kwargs):
+        self._memloader()
         return super().__class_getitem__(*args, **kwargs)
 
-    @_load_mem
     def __contains__(self, *args, **kwargs):
+        self._memloader()
         return super().__contains__(*args, **kwargs)
 
-    def cleanup(self):
-        self._memshared.close()
-        if not self._mem_exists:
-            self._memshared.unlink()
-            gc.collect()
-
-    @_load_mem
     def __eq__(self, *args, **kwargs):
+        self._memloader()
         return super().__eq__(*args, **kwargs)
 
-    @_load_mem
     def __format__(self, *args, **kwargs):
+        self._memloader()
         return super().__format__(*args, **kwargs)
 
-    @_load_mem
     def __ge__(self, *args, **kwargs):
+        self._memloader()
         return super().__ge__(*args, **kwargs)
 
-    @_load_mem
     def __gt__(self, *args, **kwargs):
+        self._memloader()
         return super().__gt__(*args, **kwargs)
 
-    @_load_mem
     def __hash__(self, *args, **kwargs):
+        self._memloader()
         return super().__hash__(*args, **kwargs)
 
-    @_load_mem
-    @_update_mem
     def __iand__(self, *args, **kwargs):
-        return super().__iand__(*args, **kwargs)
+        with self._memlock:
+            self._memloader_nonlock()
+            size = super().__len__()
+            res = super().__iand__(*args, **kwargs)
+            if super().__len__() != size:
+                self._memupdater_nonlock()
+        return res
 
-    @_load_mem
     def __init_subclass__(self, *args, **kwargs):
+        self._memloader()
         return super().__init_subclass__(*args, **kwargs)
 
-    @_load_mem
-    @_update_mem
     def __ior__(self, *args, **kwargs):
-        return super().__ior__(*args, **kwargs)
+        with self._memlock:
+            self._memloader_nonlock()
+            size = super().__len__()
+            res = super().__ior__(*args, **kwargs)
+            if super().__len__() != size:
+                self._memupdater_nonlock()
+        return res
 
-    @_load_mem
-    @_update_mem
     def __isub__(self, *args, **kwargs):
-        return super().__isub__(*args, **kwargs)
+        with self._memlock:
+            self._memloader_nonlock()
+            size = super().__len__()
+            res = super().__isub__(*args, **kwargs)
+            if super().__len__() != size:
+                self._memupdater_nonlock()
+        return res
 
-    @_load_mem
     def __iter__(self, *args, **kwargs):
+        self._memloader()
         return super().__iter__(*args, **kwargs)
 
-    @_load_mem
-    @_update_mem
     def __ixor__(self, *args, **kwargs):
-        return super().__ixor__(*args, **kwargs)
+        with self._memlock:
+            self._memloader_nonlock()
+            res = super().__ixor__(*args, **kwargs)
+            self._memupdater_nonlock()
+        return res
 
-    @_load_mem
     def __le__(self, *args, **kwargs):
+        self._memloader()
         return super().__le__(*args, **kwargs)
 
-    @_load_mem
     def __len__(self, *args, **kwargs):
+        self._memloader()
         return super().__len__(*args, **kwargs)
 
-    @_load_mem
     def __lt__(self, *args, **kwargs):
+        self._memloader()
         return super().__lt__(*args, **kwargs)
 
-    @_load_mem
     def __ne__(self, *args, **kwargs):
+        self._memloader()
         return super().__ne__(*args, **kwargs)
 
-    @_load_mem
     def __or__(self, *args, **kwargs):
+        self._memloader()
         return super().__or__(*args, **kwargs)
 
-    @_load_mem
     def __rand__(self, *args, **kwargs):
+        self._memloader()
         return super().__rand__(*args, **kwargs)
 
-    @_load_mem
     def __reduce__(self, *args, **kwargs):
+        self._memloader()
         return super().__reduce__(*args, **kwargs)
 
-    @_load_mem
     def __reduce_ex__(self, *args, **kwargs):
+        self._memloader()
         return super().__reduce_ex__(*args, **kwargs)
 
-    @_load_mem
     def __repr__(self, *args, **kwargs):
+        self._memloader()
         return super().__repr__(*args, **kwargs)
 
-    @_load_mem
     def __ror__(self, *args, **kwargs):
+        self._memloader()
         return super().__ror__(*args, **kwargs)
 
-    @_load_mem
     def __rsub__(self, *args, **kwargs):
+        self._memloader()
         return super().__rsub__(*args, **kwargs)
 
-    @_load_mem
     def __rxor__(self, *args, **kwargs):
+        self._memloader()
         return super().__rxor__(*args, **kwargs)
 
-    @_load_mem
     def __sizeof__(self, *args, **kwargs):
+        self._memloader()
         return super().__sizeof__(*args, **kwargs)
 
-    @_load_mem
     def __str__(self, *args, **kwargs):
+        self._memloader()
         return super().__str__(*args, **kwargs)
 
-    @_load_mem
     def __sub__(self, *args, **kwargs):
+        self._memloader()
         return super().__sub__(*args, **kwargs)
 
-    @_load_mem
     def __xor__(self, *args, **kwargs):
+        self._memloader()
         return super().__xor__(*args, **kwargs)
 
-    @_load_mem
-    @_update_mem
-    def add(self, *args, **kwargs):
-        return super().add(*args, **kwargs)
+    def add(self, value):
+        with self._memlock:
+            self._memloader_nonlock()
+            size = super().__len__()
+            res = super().add(value)
+            if super().__len__() != size:
+                self._memjournal_nonlock(value, "add", value)
+        return res
 
-    @_load_mem
-    @_update_mem
     def clear(self, *args, **kwargs):
-        return super().clear(*args, **kwargs)
+        with self._memlock:
+            self._memloader_nonlock()
+            size = super().__len__()
+            res = super().clear(*args, **kwargs)
+            if super().__len__() != size:
+                self._memupdater_nonlock()
+        return res
 
-    @_load_mem
     def copy(self, *args, **kwargs):
+        self._memloader()
         return super().copy(*args, **kwargs)
 
-    @_load_mem
     def difference(self, *args, **kwargs):
+        self._memloader()
         return super().difference(*args, **kwargs)
 
-    @_load_mem
-    @_update_mem
     def difference_update(self, *args, **kwargs):
-        return super().difference_update(*args, **kwargs)
+        with self._memlock:
+            self._memloader_nonlock()
+            size = super().__len__()
+            res = super().difference_update(*args, **kwargs)
+            if super().__len__() != size:
+                self._memupdater_nonlock()
+        return res
+
+    def discard(self, value):
+        with self._memlock:
+            self._memloader_nonlock()
+            size = super().__len__()
+            res = super().discard(value)
+            if super().__len__() != size:
+                self._memjournal_nonlock(value, "discard", value)
+        return res
 
-    @_load_mem
-    @_update_mem
-    def discard(self, *args, **kwargs):
-        return super().discard(*args, **kwargs)
-
-    @_load_mem
     def intersection(self, *args, **kwargs):
+        self._memloader()
         return super().intersection(*args, **kwargs)
 
-    @_load_mem
-    @_update_mem
     def intersection_update(self, *args, **kwargs):
-        return super().intersection_update(*args, **kwargs)
+        with self._memlock:
+            self._memloader_nonlock()
+            size = super().__len__()
+            res = super().intersection_update(*args, **kwargs)
+            if super().__len__() != size:
+                self._memupdater_nonlock()
+        return res
 
-    @_load_mem
     def isdisjoint(self, *args, **kwargs):
+        self._memloader()
         return super().isdisjoint(*args, **kwargs)
 
-    @_load_mem
     def issubset(self, *args, **kwargs):
+        self._memloader()
         return super().issubset(*args, **kwargs)
 
-    @_load_mem
     def issuperset(self, *args, **kwargs):
+        self._memloader()
         return super().issuperset(*args, **kwargs)
 
-    @_load_mem
-    @_update_mem
-    def pop(self, *args, **kwargs):
-        return super().pop(*args, **kwargs)
+    def pop(self):
+        with self._memlock:
+            self._memloader_nonlock()
+            res = super().pop()
+            self._memjournal_nonlock(res, "discard", res)
+        return res
 
-    @_load_mem
-    @_update_mem
-    def remove(self, *args, **kwargs):
-        return super().remove(*args, **kwargs)
+    def remove(self, value):
+        with self._memlock:
+            self._memloader_nonlock()
+            res = super().remove(value)
+            self._memjournal_nonlock(value, "discard", value)
+        return res
 
-    @_load_mem
     def symmetric_difference(self, *args, **kwargs):
+        self._memloader()
         return super().symmetric_difference(*args, **kwargs)
 
-    @_load_mem
-    @_update_mem
     def symmetric_difference_update(self, *args, **kwargs):
-        return super().symmetric_difference_update(*args, **kwargs)
+        with self._memlock:
+            self._memloader_nonlock()
+            res = super().symmetric_difference_update(*args, **kwargs)
+            self._memupdater_nonlock()
+        return res
 
-    @_load_mem
     def union(self, *args, **kwargs):
+        self._memloader()
         return super().union(*args, **kwargs)
 
-    @_load_mem
-    @_update_mem
     def update(self, *args, **kwargs):
-        return super().update(*args, **kwargs)
+        with self._memlock:
+            self._memloader_nonlock()
+            size = super().__len__()
+            res = super().update(*args, **kwargs)
+            if super().__len__() != size:
+                self._memupdater_nonlock()
+        return res
+
+
+_dispatch_table = copyreg.dispatch_table.copy()
+_dispatch_table[MemSharedDict] = _reduce_shared_dict
+_dispatch_table[MemSharedList] = _reduce_shared_list
+_dispatch_table[MemSharedSet] = _reduce_shared_set
@@ -0,0 +1,56 @@
+import importlib.util
+import os
+import subprocess
+import sys
+import textwrap
+import unittest
+import uuid
+
+# the repository root is the package itself, it is imported under its real name
+_tests = os.path.dirname(os.path.abspath(__file__))
+_root = os.path.dirname(_tests)
+if "sharedbuiltinmutables" not in sys.modules:
+    _spec = importlib.util.spec_from_file_location(
+        "sharedbuiltinmutables", os.path.join(_root, "__init__.py")
+    )
+    sharedbuiltinmutables = importlib.util.module_from_spec(_spec)
+    sys.modules[_spec.name] = sharedbuiltinmutables
+    _spec.loader.exec_module(sharedbuiltinmutables)
+else:
+    sharedbuiltinmutables = sys.modules["sharedbuiltinmutables"]
+
+
+def run_python(code):
+    # runs code in a new interpreter that imports the package like the tests do
+    prelude = textwrap.dedent(
+        f"""
+        import sys
+        sys.path.insert(0, {_tests!r})
+        import support
+        from sharedbuiltinmutables import MemSharedDict, MemSharedList, MemSharedSet
+        """
+    )
+    return subprocess.run(
+        [sys.executable, "-c", prelude + textwrap.dedent(code)],
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+
+
+class SharedTestCase(unittest.TestCase):
+    # every test gets a fresh block name, the instances made with instance() are
+    # cleaned up afterwards
+    def setUp(self):
+        self.name = f"test_{uuid.uuid4().hex[:12]}"
+        self.instances = []
+
+    def tearDown(self):
+        # the creator (first instance) unlinks, so it is cleaned up last
+        for it in reversed(self.instances):
+            it.cleanup()
+
+    def instance(self, cls, *args, **kwargs):
+        it = cls(*args, name=self.name, **kwargs)
+        self.instances.append(it)
+        return it
@@ -0,0 +1,54 @@
+import unittest
+
+from support import SharedTestCase, run_python
+from sharedbuiltinmutables import MemSharedDict, MemSharedList
+
+
+class GrowTest(SharedTestCase):
+    def test_attached_instance_sees_data_after_growth(self):
+        a = self.instance(MemSharedDict, {"init": 1})
+        b = self.instance(MemSharedDict)
+        self.assertEqual(b, {"init": 1})
+        a.update({i: "y" * 100 for i in range(5000)})
+        self.assertGreater(a._memgen, 0)
+        self.assertEqual(len(b), 5001)
+        self.assertEqual(b, a)
+        self.assertEqual(self.instance(MemSharedDict), a)
+
+    def test_changes_after_growth_reach_everyone(self):
+        a = self.instance(MemSharedList)
+        b = self.instance(MemSharedList)
+        for i in range(3000):
+            a.append("x" * 50 + str(i))
+        self.assertEqual(len(b), 3000)
+        # b writes into the generation it followed, a and a new instance read it
+        for i in range(2000):
+            b.append(i)
+        self.assertEqual(a._memgen, b._memgen)
+        self.assertEqual(len(a), 5000)
+        self.assertEqual(a, b)
+        self.assertEqual(self.instance(MemSharedList), a)
+
+    def test_generation_outlives_the_process_that_made_it(self):
+        a = self.instance(MemSharedDict, {"a": 1})
+        run_python(
+            f"""
+            d = MemSharedDict(name={self.name!r})
+            d.update({{i: "x" * 100 for i in range(5000)}})
+            assert d._memgen > 0
+            d.cleanup()
+            """
+        )
+        self.assertEqual(len(a), 5001)
+        out = run_python(
+            f"""
+            d = MemSharedDict(name={self.name!r})
+            print(len(d), d[4999])
+            d.cleanup()
+            """
+        )
+        self.assertEqual(out.split(), ["5001", "x" * 100])
+
+
+if __name__ == "__main__":
+    unittest.main()
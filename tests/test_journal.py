@@ -0,0 +1,154 @@
+import unittest
+
+from support import SharedTestCase, sharedbuiltinmutables
+from sharedbuiltinmutables import MemSharedDict, MemSharedList, MemSharedSet
+
+_header = sharedbuiltinmutables._header
+
+
+class Unpicklable:
+    def __reduce__(self):
+        raise TypeError("not picklable")
+
+
+def _insert(l):
+    l.insert(-2, "x")
+
+
+def _del_slice(l):
+    del l[1:3]
+
+
+def _set_slice(l):
+    l[1:2] = ["a", "b", "c"]
+
+
+def _set_extended_slice(l):
+    l[::2] = ["s"] * len(l[::2])
+
+
+def _set_negative(l):
+    l[-1] = "last"
+
+
+def _del_negative(l):
+    del l[-2]
+
+
+class ReplayTest(SharedTestCase):
+    # a changes, b (attached before) has to end up with the same contents,
+    # either by replaying the journal or by loading a snapshot
+    def check(self, cls, initial, ops):
+        plain = type(initial)(initial)
+        a = self.instance(cls, initial)
+        b = self.instance(cls)
+        lagging = self.instance(cls)
+        self.assertEqual(b, plain)
+        self.assertEqual(lagging, plain)
+        for op in ops:
+            expected = op(plain)
+            result = op(a)
+            self.assertEqual(result, expected)
+            # b reads after every change, lagging replays all of them at once
+            self.assertEqual(b, plain)
+        self.assertEqual(lagging, plain)
+        self.assertEqual(self.instance(cls), plain)
+
+    def test_list(self):
+        self.check(
+            MemSharedList,
+            list(range(10)),
+            [
+                lambda l: l.pop(-1),
+                lambda l: l.pop(0),
+                _insert,
+                lambda l: l.append("y"),
+                _del_slice,
+                _set_slice,
+                _set_extended_slice,
+                _set_negative,
+                _del_negative,
+                lambda l: l.extend([1, 2]),
+            ],
+        )
+
+    def test_set(self):
+        self.check(
+            MemSharedSet,
+            set(range(10)),
+            [
+                lambda s: s.discard(3),
+                lambda s: s.discard(99),
+                lambda s: s.add("n"),
+                lambda s: s.remove(4),
+            ],
+        )
+
+    def test_set_pop(self):
+        a = self.instance(MemSharedSet, {1, 2, 3})
+        b = self.instance(MemSharedSet)
+        popped = {a.pop(), a.pop()}
+        self.assertEqual(b, {1, 2, 3} - popped)
+        self.assertEqual(self.instance(MemSharedSet), {1, 2, 3} - popped)
+
+    def test_dict(self):
+        self.check(
+            MemSharedDict,
+            {i: str(i) for i in range(10)},
+            [
+                lambda d: d.popitem(),
+                lambda d: d.setdefault("new", []),
+                lambda d: d.setdefault(1, "unused"),
+                lambda d: d.pop(2),
+                lambda d: d.pop("missing", None),
+                lambda d: d.__setitem__((1, 2), "tuple key"),
+                lambda d: d.__delitem__(3),
+            ],
+        )
+
+    def test_lagging_reader_after_journal_overflow(self):
+        a = self.instance(MemSharedList, [0])
+        b = self.instance(MemSharedList)
+        self.assertEqual(b, [0])
+        seen = b._memhashold
+        for i in range(200):
+            a.append(i)
+        # the journal outgrew the snapshot, b's state isn't in it anymore
+        snapseq = _header.unpack_from(a._memshared.buf)[2]
+        self.assertGreater(snapseq, seen + 1)
+        self.assertEqual(b, [0, *range(200)])
+
+    def test_out_of_band_buffers(self):
+        a = self.instance(MemSharedDict, {"b": bytearray(b"x" * 10000)})
+        b = self.instance(MemSharedDict)
+        value = b["b"]
+        self.assertEqual(value, bytearray(b"x" * 10000))
+        a["b"] = bytearray(b"y" * 10000)
+        # b's copy doesn't alias the shared memory block
+        self.assertEqual(value, bytearray(b"x" * 10000))
+        self.assertEqual(b["b"], bytearray(b"y" * 10000))
+
+
+class SnapshotTest(SharedTestCase):
+    def test_failed_write_leaves_snapshot_readable(self):
+        a = self.instance(MemSharedDict, {i: "x" * 30 for i in range(3000)})
+        with self.assertRaises(TypeError):
+            a.update({0: "CHANGED" * 50, "zz": Unpicklable()})
+        b = self.instance(MemSharedDict)
+        self.assertEqual(len(b), 3000)
+        self.assertEqual(b[0], "x" * 30)
+
+    def test_snapshots_use_free_space(self):
+        a = self.instance(MemSharedDict)
+        b = self.instance(MemSharedDict)
+        starts = set()
+        for i in range(6):
+            a.update({k: str(i) * 50 for k in range(200)})
+            starts.add(_header.unpack_from(a._memshared.buf)[6])
+            self.assertEqual(b, a)
+        # the snapshot moved between the front and the back of the block
+        self.assertGreater(len(starts), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,84 @@
+import multiprocessing
+import threading
+import unittest
+
+from support import SharedTestCase
+from sharedbuiltinmutables import MemSharedDict, MemSharedList
+
+WORKERS = 4
+ROUNDS = 150
+
+
+def _count(name, rounds):
+    d = MemSharedDict(name=name)
+    for i in range(rounds):
+        with d.transaction():
+            d["count"] += 1
+            # makes the data grow while the others are writing
+            d[f"{id(d)}_{i}"] = "x" * 40
+    d.cleanup()
+
+
+def _append(name, k, rounds):
+    l = MemSharedList(name=name)
+    for i in range(rounds):
+        l.append((k, i))
+    l.cleanup()
+
+
+class ProcessTest(SharedTestCase):
+    def run_workers(self, target, args):
+        # args(k) are the arguments of worker k
+        ctx = multiprocessing.get_context("spawn")
+        workers = [ctx.Process(target=target, args=args(k)) for k in range(WORKERS)]
+        for p in workers:
+            p.start()
+        for p in workers:
+            p.join()
+            self.assertEqual(p.exitcode, 0)
+
+    def test_transaction_counter(self):
+        d = self.instance(MemSharedDict, {"count": 0})
+        self.run_workers(_count, lambda k: (self.name, ROUNDS))
+        self.assertEqual(d["count"], WORKERS * ROUNDS)
+        self.assertEqual(len(d), WORKERS * ROUNDS + 1)
+
+    def test_journaled_appends(self):
+        l = self.instance(MemSharedList)
+        self.run_workers(_append, lambda k: (self.name, k, ROUNDS))
+        self.assertEqual(len(l), WORKERS * ROUNDS)
+        for k in range(WORKERS):
+            # each process' appends stay in their order
+            self.assertEqual([i for j, i in l if j == k], list(range(ROUNDS)))
+
+
+class ThreadTest(SharedTestCase):
+    def test_transaction_is_exclusive_across_threads(self):
+        d = self.instance(MemSharedDict, {"count": 0})
+        inside = []
+        overlaps = []
+
+        def work():
+            for _ in range(ROUNDS):
+                with d.transaction():
+                    inside.append(threading.get_ident())
+                    d["count"] += 1
+                    # nesting in the same thread
+                    with d.transaction():
+                        d["count"] += 1
+                    if len(inside) != 1:
+                        overlaps.append(list(inside))
+                    inside.pop()
+
+        threads = [threading.Thread(target=work) for _ in range(WORKERS)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(overlaps, [])
+        self.assertEqual(d["count"], 2 * WORKERS * ROUNDS)
+        self.assertEqual(self.instance(MemSharedDict)["count"], 2 * WORKERS * ROUNDS)
+
+
+if __name__ == "__main__":
+    unittest.main()
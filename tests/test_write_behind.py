@@ -0,0 +1,86 @@
+import contextlib
+import io
+import threading
+import time
+import unittest
+
+from support import SharedTestCase, run_python
+from sharedbuiltinmutables import MemSharedDict
+
+
+def wait_for(condition, timeout=2.0):
+    end = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > end:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+class WriteBehindTest(SharedTestCase):
+    def test_background_write(self):
+        reader = self.instance(MemSharedDict)
+        a = self.instance(MemSharedDict, write_behind=True)
+        for i in range(100):
+            a[i] = i
+        self.assertTrue(wait_for(lambda: len(reader) == 100))
+        self.assertFalse(a._mempending)
+
+    def test_flush(self):
+        reader = self.instance(MemSharedDict)
+        a = self.instance(MemSharedDict, write_behind=True)
+        with a._memlock:  # keeps the background thread from writing first
+            a["x"] = 1
+            self.assertTrue(a._mempending)
+        a.flush()
+        self.assertFalse(a._mempending)
+        self.assertEqual(reader, {"x": 1})
+        self.assertEqual(self.instance(MemSharedDict), {"x": 1})
+
+    def test_cleanup_flushes_and_stops_the_thread(self):
+        reader = self.instance(MemSharedDict)
+        a = MemSharedDict(name=self.name, write_behind=True)
+        with a._memlock:
+            a["x"] = 1
+            thread = a._memwriter[1]
+        a.cleanup()
+        thread.join(2.0)
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(reader, {"x": 1})
+
+    def test_exit_flushes(self):
+        reader = self.instance(MemSharedDict)
+        run_python(
+            f"""
+            d = MemSharedDict(name={self.name!r}, write_behind=True)
+            with d._memlock:
+                d.update({{i: i for i in range(50)}})
+            # neither flush() nor cleanup(), the exit hook writes
+            """
+        )
+        self.assertEqual(reader, {i: i for i in range(50)})
+
+    def test_writes_again_after_a_failed_write(self):
+        reader = self.instance(MemSharedDict)
+        a = self.instance(MemSharedDict, write_behind=True)
+        with contextlib.redirect_stderr(io.StringIO()) as err:
+            a["g"] = (x for x in range(3))
+            self.assertTrue(wait_for(lambda: "Failed to write" in err.getvalue()))
+        del a["g"]
+        a["ok"] = 1
+        self.assertTrue(wait_for(lambda: reader == {"ok": 1}))
+        self.assertTrue(wait_for(lambda: not a._mempending))
+
+    def test_dropped_instance_stops_its_thread(self):
+        self.instance(MemSharedDict)
+        a = MemSharedDict(name=self.name, write_behind=True)
+        a[1] = 1
+        a.flush()
+        thread = a._memwriter[1]
+        del a
+        thread.join(2.0)
+        self.assertFalse(thread.is_alive())
+
+
+if __name__ == "__main__":
+    unittest.main()